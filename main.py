@@ -1,11 +1,18 @@
 import os
-from openai import OpenAI
+from openai import AsyncOpenAI
 from dotenv import load_dotenv
 import time
 import threading
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 import logging
+import json
+import datetime
+from collections import deque
 from typing import Dict, Any, List, Tuple
+import struct
 import snap7
+from snap7.util import get_real
 
 # Setup logging
 logging.basicConfig(level=logging.INFO,
@@ -18,6 +25,40 @@ base_url = os.getenv("BASE_URL")
 deepseek_api_key = os.getenv("GEMINI_API_KEY")
 deepseek_model = os.getenv("GEMINI_MODEL")
 
+# Sensor name -> MD address. MD0..MD8 are read together in one request.
+SENSOR_ADDRESSES = {
+    "Isik": 0,
+    "CO2": 2,
+    "ToprakNemi": 4,
+    "Nem": 6,
+    "Sicaklik": 8
+}
+SENSOR_READ_SIZE = max(SENSOR_ADDRESSES.values()) + 4
+# Big-endian S7 REAL, compiled once for decoding the sensor block
+SENSOR_REAL = struct.Struct('>f')
+
+# Number of recent sensor readings kept for trend context
+SENSOR_HISTORY_SIZE = 5
+
+# Time-of-day context for the AI prompt, indexed by hour
+TIME_CONTEXTS = (["Şu an akşam/gece vakti."] * 6 +
+                 ["Şu an sabah vakti."] * 6 +
+                 ["Şu an öğleden sonra/öğle vakti."] * 6 +
+                 ["Şu an akşam/gece vakti."] * 6)
+
+# Smallest change per sensor that triggers a new AI analysis
+SENSOR_EPSILONS = {
+    "Isik": 50.0,
+    "CO2": 20.0,
+    "ToprakNemi": 2.0,
+    "Nem": 2.0,
+    "Sicaklik": 0.5
+}
+
+# Analysis (3 slots) and alerts (5 slots) are consecutive 230-char strings
+# in this DB, each slot taking 232 bytes (DB1.0, DB1.232, ..., DB1.1624).
+STATUS_DB_NUMBER = 1
+
 
 class PLCConnection:
     """Class to handle PLC connections and operations for sera control"""
@@ -34,20 +75,58 @@ class PLCConnection:
         self.rack = rack
         self.slot = slot
         self.plc_client = None
+        self._connected = False
+        # Incremented on every successful connect, so callers can tell
+        # when the PLC may have lost its output and DB state
+        self.connection_generation = 0
+        # Reusable DB write buffers keyed by size
+        self._db_buffers: Dict[int, bytearray] = {}
         self.connect()
-        logger.info(
-            f"PLC connection initialized to {ip_address} rack {rack} slot {slot}")
+        logger.info("PLC connection initialized to %s rack %s slot %s",
+                    ip_address, rack, slot)
 
     def connect(self):
         """Connect to the PLC"""
         try:
-            import snap7
             self.plc_client = snap7.client.Client()
             self.plc_client.connect(self.ip_address, self.rack, self.slot)
+            self._connected = True
+            self.connection_generation += 1
             logger.info("Successfully connected to PLC")
         except Exception as e:
             logger.error(f"Failed to connect to PLC: {str(e)}")
             self.plc_client = None
+            self._connected = False
+
+    def check_connection(self) -> bool:
+        """Refresh the cached connection state from the PLC client
+
+        Called once per monitoring cycle; I/O methods rely on the cached
+        flag instead of querying the client on every operation.
+
+        Returns:
+            Connection status (True/False)
+        """
+        try:
+            self._connected = bool(
+                self.plc_client and self.plc_client.get_connected())
+        except Exception as e:
+            logger.error(f"Error checking PLC connection: {str(e)}")
+            self._connected = False
+        return self._connected
+
+    def _ensure_connected(self) -> bool:
+        """Reconnect if the cached connection state is down
+
+        Returns:
+            Connection status (True/False)
+        """
+        if not self._connected:
+            self.connect()
+            if not self._connected:
+                logger.error("Not connected to PLC")
+                return False
+        return True
 
     def read_md_float(self, md_address: int) -> float:
         """Read a float value from MD area
@@ -59,22 +138,18 @@ class PLCConnection:
             Float value from the PLC
         """
         try:
-            if not self.plc_client or not self.plc_client.get_connected():
-                self.connect()
-                if not self.plc_client or not self.plc_client.get_connected():
-                    logger.error("Not connected to PLC")
-                    return 0.0
+            if not self._ensure_connected():
+                return 0.0
 
             # Read 4 bytes from the MD area (float is 4 bytes)
             result = self.plc_client.read_area(
                 snap7.type.Areas.MK, 0, md_address, 4)
 
             # Convert the bytes to float
-            import struct
-            value = struct.unpack('>f', result)
-            return value[0]
+            return get_real(result, 0)
         except Exception as e:
             logger.error(f"Error reading from MD{md_address}: {str(e)}")
+            self._connected = False
             return 0.0
 
     def write_bool(self, output_address: str, value: bool) -> bool:
@@ -88,19 +163,11 @@ class PLCConnection:
             Success status (True/False)
         """
         try:
-            if not self.plc_client or not self.plc_client.get_connected():
-                self.connect()
-                if not self.plc_client or not self.plc_client.get_connected():
-                    logger.error("Not connected to PLC")
-                    return False
+            if not self._ensure_connected():
+                return False
 
-            # Parse the output address (e.g. "Q0.0")
-            if not output_address.startswith("Q"):
-                output_address = output_address.replace("%Q", "Q")
-
-            parts = output_address.replace("Q", "").split(".")
-            byte_offset = int(parts[0])
-            bit_offset = int(parts[1])
+            byte_offset, bit_offset = self.parse_output_address(
+                output_address)
 
             # Read the current byte
             result = self.plc_client.read_area(
@@ -120,12 +187,72 @@ class PLCConnection:
             self.plc_client.write_area(
                 snap7.type.Areas.PA, 0, byte_offset, result)
 
-            logger.info(f"Successfully wrote {value} to {output_address}")
+            logger.info("Successfully wrote %s to %s", value, output_address)
             return True
         except Exception as e:
             logger.error(f"Error writing to {output_address}: {str(e)}")
+            self._connected = False
+            return False
+
+    def write_bool_masks(self, bits: Dict[Tuple[int, int], bool]) -> bool:
+        """Write boolean values to Q outputs given as precomputed bit masks
+
+        Args:
+            bits: Mapping of (byte offset, bit mask) to value
+
+        Returns:
+            Success status (True/False)
+        """
+        if not bits:
+            return True
+
+        first_byte = min(byte_offset for byte_offset, _ in bits)
+        last_byte = max(byte_offset for byte_offset, _ in bits)
+
+        try:
+            if not self._ensure_connected():
+                return False
+
+            # Read all affected bytes at once
+            result = self.plc_client.read_area(
+                snap7.type.Areas.PA, 0, first_byte, last_byte - first_byte + 1)
+
+            # Modify the bits in memory
+            for (byte_offset, mask), value in bits.items():
+                if value:
+                    result[byte_offset - first_byte] |= mask  # Set bit
+                else:
+                    result[byte_offset - first_byte] &= ~mask  # Clear bit
+
+            # Write back the modified bytes
+            self.plc_client.write_area(
+                snap7.type.Areas.PA, 0, first_byte, result)
+
+            logger.info("Successfully wrote QB%s..QB%s = %s",
+                        first_byte, last_byte, result.hex())
+            return True
+        except Exception as e:
+            logger.error(
+                f"Error writing to QB{first_byte}..QB{last_byte}: {str(e)}")
+            self._connected = False
             return False
 
+    @staticmethod
+    def parse_output_address(output_address: str) -> Tuple[int, int]:
+        """Parse a Q output address
+
+        Args:
+            output_address: Output address (e.g. "Q0.0" or "%Q0.0")
+
+        Returns:
+            Tuple of (byte offset, bit offset)
+        """
+        if not output_address.startswith("Q"):
+            output_address = output_address.replace("%Q", "Q")
+
+        parts = output_address.replace("Q", "").split(".")
+        return int(parts[0]), int(parts[1])
+
     def write_db_string(self, db_number: int, start_offset: int, data: str, max_size: int = 230) -> bool:
         """
         Write a string value to a DB area
@@ -139,39 +266,93 @@ class PLCConnection:
                 Success status (True/False)
         """
         try:
-            if not self.plc_client or not self.plc_client.get_connected():
-                self.connect()
-                if not self.plc_client or not self.plc_client.get_connected():
-                    logger.error("Not connected to PLC")
-                    return False
+            if not self._ensure_connected():
+                return False
 
             # Prepare the string in Siemens format
             # +2 for header (max length and actual length)
-            buffer = bytearray(max_size + 2)
+            buffer = self._db_buffer(max_size + 2)
+            self._pack_db_string(buffer, 0, data, max_size)
 
-            # Set maximum string length (first byte)
-            buffer[0] = max_size
+            # Write to PLC
+            self.plc_client.db_write(db_number, start_offset, buffer)
+            logger.info("Successfully wrote string '%s' to DB%s.%s",
+                        data, db_number, start_offset)
+            return True
 
-            # Set actual string length (second byte)
-            actual_length = min(len(data), max_size)
-            buffer[1] = actual_length
+        except Exception as e:
+            logger.error(f"Error writing to DB{db_number}: {str(e)}")
+            self._connected = False
+            return False
 
-            # Convert the string to bytes and copy it to the buffer
-            data_bytes = data.encode('ascii', 'ignore')
-            for i in range(actual_length):
-                if i < len(data_bytes):
-                    buffer[i + 2] = data_bytes[i]
+    def write_db_strings(self, db_number: int, start_offset: int, strings: List[str], max_size: int = 230) -> bool:
+        """
+        Write several string values to consecutive slots of a DB area in one request
+            Args:
+                db_number: DB number to write to
+                start_offset: Start offset of the first slot within the DB
+                strings: String data to write, one per slot
+                max_size: Maximum string size of each slot (default: 230)
 
-            # Write to PLC
+            Returns:
+                Success status (True/False)
+        """
+        try:
+            if not self._ensure_connected():
+                return False
+
+            # Each slot is a Siemens string: 2 header bytes + max_size chars
+            slot_size = max_size + 2
+            buffer = self._db_buffer(slot_size * len(strings))
+            for index, data in enumerate(strings):
+                self._pack_db_string(buffer, index * slot_size, data, max_size)
+
+            # Write to PLC; snap7 splits the transfer to the negotiated PDU size
             self.plc_client.db_write(db_number, start_offset, buffer)
-            logger.info(
-                f"Successfully wrote string '{data}' to DB{db_number}.{start_offset}")
+            logger.info("Successfully wrote %s strings to DB%s.%s",
+                        len(strings), db_number, start_offset)
             return True
 
         except Exception as e:
             logger.error(f"Error writing to DB{db_number}: {str(e)}")
+            self._connected = False
             return False
 
+    def _db_buffer(self, size: int) -> bytearray:
+        """Return the reusable DB write buffer of the given size
+
+        Bytes past a string's actual length may hold data from an earlier
+        write; the PLC only reads up to the length byte.
+        """
+        buffer = self._db_buffers.get(size)
+        if buffer is None:
+            buffer = self._db_buffers[size] = bytearray(size)
+        return buffer
+
+    @staticmethod
+    def _pack_db_string(buffer: bytearray, offset: int, data: str, max_size: int):
+        """Place a string into buffer in Siemens S7 string format
+
+        Args:
+            buffer: Target buffer
+            offset: Offset of the string header within the buffer
+            data: String data to place
+            max_size: Maximum string size
+        """
+        # Convert the string to bytes; the length byte follows the encoded size
+        data_bytes = data.encode('ascii', 'ignore')
+        actual_length = min(len(data_bytes), max_size)
+
+        # Set maximum string length (first byte)
+        buffer[offset] = max_size
+
+        # Set actual string length (second byte)
+        buffer[offset + 1] = actual_length
+
+        # Copy the payload in one slice assignment
+        start = offset + 2
+        buffer[start:start + actual_length] = data_bytes[:actual_length]
+
     def read_all_sensor_data(self) -> Dict[str, float]:
         """Read all sensor data from PLC
 
@@ -180,25 +361,86 @@ class PLCConnection:
         """
         data = {}
         try:
-            data["Isik"] = self.read_md_float(0)
-            data["CO2"] = self.read_md_float(2)
-            data["ToprakNemi"] = self.read_md_float(4)
-            data["Nem"] = self.read_md_float(6)
-            data["Sicaklik"] = self.read_md_float(8)
+            if not self._ensure_connected():
+                return {}
+
+            # Read the whole MD0..MD8 range in a single request
+            result = self.plc_client.read_area(
+                snap7.type.Areas.MK, 0, 0, SENSOR_READ_SIZE)
+
+            # Decode in place from the returned buffer, without slicing copies
+            for name, md_address in SENSOR_ADDRESSES.items():
+                data[name] = SENSOR_REAL.unpack_from(result, md_address)[0]
 
             # Log the readings
-            logger.info(f"Sera Işık Değeri: {data['Isik']}")
-            logger.info(f"CO2 Seviyesi: {data['CO2']}")
-            logger.info(f"Toprak Nemi: {data['ToprakNemi']}")
-            logger.info(f"Nem Seviyesi: {data['Nem']}")
-            logger.info(f"Sıcaklık: {data['Sicaklik']}")
+            logger.info("Sera Işık Değeri: %s", data['Isik'])
+            logger.info("CO2 Seviyesi: %s", data['CO2'])
+            logger.info("Toprak Nemi: %s", data['ToprakNemi'])
+            logger.info("Nem Seviyesi: %s", data['Nem'])
+            logger.info("Sıcaklık: %s", data['Sicaklik'])
 
             return data
         except Exception as e:
             logger.error(f"Error reading sensor data: {str(e)}")
+            self._connected = False
             return {}
 
 
+# Alert returned by AIAgent.analyze_data when the analysis fails
+AI_ERROR_ALERT = "AI analizi başarısız"
+
+# Analysis prompt. The static part comes first so every request shares
+# the same prefix, which lets the AI service cache it.
+SYSTEM_MESSAGE = {
+    "role": "system",
+    "content": "Sen bir sera otomasyonu asistanısın. Sera sensör verilerini analiz ederek en iyi büyüme koşullarını sağlamak için ekipmanların kontrolünü önerirsin."
+}
+
+PROMPT_STATIC = """
+Bir serada optimal koşullar:
+- Sıcaklık: 20-28°C arası olmalı
+- Nem: %60-80 arası olmalı
+- Toprak Nemi: %70-90 arası olmalı
+- CO2: 800-1200 ppm arası olmalı
+- Işık: Sabah/öğlen saatlerinde yüksek, akşam düşük olmalı
+
+En sonda verilen sera verilerine göre, seranın durumunu analiz et ve uygun eylemleri öner.
+Aşağıdaki ekipmanları kontrol edebilirsin (True=açık, False=kapalı):
+- Havalandırma (%Q0.0): Sıcaklık/nem/CO2 kontrolü için
+- Gölgelendirme (%Q0.1): Işık kontrolü için
+- Isıtıcı (%Q0.2): Sıcaklık kontrolü için
+- Nemlendirici (%Q0.3): Nem kontrolü için
+- Sulama (%Q0.4): Toprak nemi kontrolü için
+- Drenaj (%Q0.5): Fazla su kontrolü için
+- CO2_Tupu (%Q0.6): CO2 seviyesi kontrolü için
+- Led (%Q0.7): Ek ışık kontrolü için
+
+Yanıtını aşağıdaki JSON formatında ver:
+{
+    "analiz": "mevcut durum analizi",
+    "eylemler": [
+        {"ekipman": "ekipman_adı(Örn: Havalandırma,Gölgelendirme,Isıtıcı,Nemlendirici,Sulama,Drenaj,CO2_Tupu,Led)", "durum": true/false, "neden": "bu eylemin nedeni"}
+    ],
+    "uyarılar": [
+        "serada oluşabilecek sorunlar ile ilgili uyarılar"
+    ]
+}
+"""
+
+# Per-call part of the analysis prompt, appended after PROMPT_STATIC
+PROMPT_SENSORS = """
+Sera Sensör Verileri:
+Işık Değeri: {isik}
+CO2 Seviyesi: {co2}
+Toprak Nemi: {toprak_nemi}
+Nem Seviyesi: {nem}
+Sıcaklık: {sicaklik}
+
+Ek Bilgiler:
+{context}
+"""
+
+
 class AIAgent:
     """AI Agent that analyzes PLC data and makes decisions for sera control"""
 
@@ -214,10 +456,10 @@ class AIAgent:
         client_args = {"api_key": api_key}
         if base_url:
             client_args["base_url"] = base_url
-        self.client = OpenAI(**client_args)
-        logger.info(f"AI Agent initialized with model {model_name}")
+        self.client = AsyncOpenAI(**client_args)
+        logger.info("AI Agent initialized with model %s", model_name)
 
-    def analyze_data(self, sensor_data: Dict[str, float], context: str = "") -> Dict[str, Any]:
+    async def analyze_data(self, sensor_data: Dict[str, float], context: str = "") -> Dict[str, Any]:
         """Analyze sera sensor data and recommend actions
 
         Args:
@@ -229,51 +471,18 @@ class AIAgent:
         """
         try:
             # Prepare the prompt with the sensor data
-            prompt = f"""
-            Sera Sensör Verileri:
-            Işık Değeri: {sensor_data.get('Isik', 'Okunamadı')}
-            CO2 Seviyesi: {sensor_data.get('CO2', 'Okunamadı')}
-            Toprak Nemi: {sensor_data.get('ToprakNemi', 'Okunamadı')}
-            Nem Seviyesi: {sensor_data.get('Nem', 'Okunamadı')}
-            Sıcaklık: {sensor_data.get('Sicaklik', 'Okunamadı')}
-            
-            Ek Bilgiler:
-            {context}
-            
-            Bir serada optimal koşullar:
-            - Sıcaklık: 20-28°C arası olmalı
-            - Nem: %60-80 arası olmalı
-            - Toprak Nemi: %70-90 arası olmalı
-            - CO2: 800-1200 ppm arası olmalı
-            - Işık: Sabah/öğlen saatlerinde yüksek, akşam düşük olmalı
-            
-            Yukarıdaki sera verilerine göre, seranın durumunu analiz et ve uygun eylemleri öner.
-            Aşağıdaki ekipmanları kontrol edebilirsin (True=açık, False=kapalı):
-            - Havalandırma (%Q0.0): Sıcaklık/nem/CO2 kontrolü için
-            - Gölgelendirme (%Q0.1): Işık kontrolü için
-            - Isıtıcı (%Q0.2): Sıcaklık kontrolü için
-            - Nemlendirici (%Q0.3): Nem kontrolü için
-            - Sulama (%Q0.4): Toprak nemi kontrolü için
-            - Drenaj (%Q0.5): Fazla su kontrolü için
-            - CO2_Tupu (%Q0.6): CO2 seviyesi kontrolü için
-            - Led (%Q0.7): Ek ışık kontrolü için
-            
-            Yanıtını aşağıdaki JSON formatında ver:
-            {{
-                "analiz": "mevcut durum analizi",
-                "eylemler": [
-                    {{"ekipman": "ekipman_adı(Örn: Havalandırma,Gölgelendirme,Isıtıcı,Nemlendirici,Sulama,Drenaj,CO2_Tupu,Led)", "durum": true/false, "neden": "bu eylemin nedeni"}}
-                ],
-                "uyarılar": [
-                    "serada oluşabilecek sorunlar ile ilgili uyarılar"
-                ]
-            }}
-            """
-
-            response = self.client.chat.completions.create(
+            prompt = PROMPT_STATIC + PROMPT_SENSORS.format(
+                isik=sensor_data.get('Isik', 'Okunamadı'),
+                co2=sensor_data.get('CO2', 'Okunamadı'),
+                toprak_nemi=sensor_data.get('ToprakNemi', 'Okunamadı'),
+                nem=sensor_data.get('Nem', 'Okunamadı'),
+                sicaklik=sensor_data.get('Sicaklik', 'Okunamadı'),
+                context=context)
+
+            response = await self.client.chat.completions.create(
                 model=self.model_name,
                 messages=[
-                    {"role": "system", "content": "Sen bir sera otomasyonu asistanısın. Sera sensör verilerini analiz ederek en iyi büyüme koşullarını sağlamak için ekipmanların kontrolünü önerirsin."},
+                    SYSTEM_MESSAGE,
                     {"role": "user", "content": prompt}
                 ],
                 response_format={"type": "json_object"}
@@ -281,7 +490,6 @@ class AIAgent:
 
             # Extract and parse the response
             result = response.choices[0].message.content
-            import json
             return json.loads(result)
 
         except Exception as e:
@@ -289,24 +497,23 @@ class AIAgent:
             return {
                 "analiz": f"Hata oluştu: {str(e)}",
                 "eylemler": [],
-                "uyarılar": ["AI analizi başarısız"]
+                "uyarılar": [AI_ERROR_ALERT]
             }
 
 
-def util(text):
-    replacements = {
-        'ç': 'c', 'Ç': 'C',
-        'ğ': 'g', 'Ğ': 'G',
-        'ı': 'i', 'İ': 'I',
-        'ö': 'o', 'Ö': 'O',
-        'ş': 's', 'Ş': 'S',
-        'ü': 'u', 'Ü': 'U'
-    }
+# Turkish characters -> ASCII equivalents for PLC strings
+_TR_TABLE = str.maketrans({
+    'ç': 'c', 'Ç': 'C',
+    'ğ': 'g', 'Ğ': 'G',
+    'ı': 'i', 'İ': 'I',
+    'ö': 'o', 'Ö': 'O',
+    'ş': 's', 'Ş': 'S',
+    'ü': 'u', 'Ü': 'U'
+})
 
-    for old, new in replacements.items():
-        text = text.replace(old, new)
 
-    return text
+def util(text):
+    return text.translate(_TR_TABLE)
 
 
 class SeraKontrolSistemi:
@@ -324,6 +531,22 @@ class SeraKontrolSistemi:
         self.ai_agent = AIAgent(
             ai_config["model_name"], ai_config["api_key"], ai_config.get("base_url"))
         self.running = False
+        # Last values successfully written to the PLC, used to skip
+        # writes that would not change anything
+        self._last_outputs: Dict[str, bool] = {}
+        self._last_status_strings: List[str] = []
+        # PLC connection generation the caches above belong to
+        self._cache_generation = self.plc.connection_generation
+        # Recent sensor readings, oldest first
+        self._history = deque(maxlen=SENSOR_HISTORY_SIZE)
+        # Sensor values and time context of the last successful analysis
+        self._last_sensors: Dict[str, float] = {}
+        self._last_time_context = ""
+        # Single worker thread that serializes all snap7 calls
+        self._plc_executor = ThreadPoolExecutor(max_workers=1)
+        # Event loop and task of the monitor thread, created by start()
+        self._loop = None
+        self._monitor_task = None
         self.monitoring_interval = plc_config.get(
             "monitoring_interval", 60)  # seconds
 
@@ -339,9 +562,18 @@ class SeraKontrolSistemi:
             "Led": "Q0.7"
         }
 
+        # Equipment name -> (byte offset, bit mask), parsed once
+        self._equipment_bits: Dict[str, Tuple[int, int]] = {}
+        for name, address in self.equipment_mapping.items():
+            byte_offset, bit_offset = PLCConnection.parse_output_address(
+                address)
+            self._equipment_bits[name] = (byte_offset, 1 << bit_offset)
+
     def start(self):
         """Start the monitoring and control loop"""
         self.running = True
+        self._loop = asyncio.new_event_loop()
+        self._monitor_task = self._loop.create_task(self._monitor())
         self.monitor_thread = threading.Thread(target=self._monitoring_loop)
         self.monitor_thread.daemon = True
         self.monitor_thread.start()
@@ -351,101 +583,214 @@ class SeraKontrolSistemi:
     def stop(self):
         """Stop the monitoring and control loop"""
         self.running = False
+        # Cancel the task so a pending wait ends immediately
+        if self._loop is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._monitor_task.cancel)
+            except RuntimeError:
+                pass  # Loop already closed
         logger.info("Sera Kontrol Sistemi durduruluyor")
 
     def _monitoring_loop(self):
         """Main monitoring loop that reads data and calls the AI agent"""
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self._monitor_task)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self._loop.close()
+
+    async def _run_plc(self, func, *args):
+        """Run a blocking PLC call on the PLC worker thread
+
+        All PLC calls go through one worker so the snap7 client is never
+        used from two threads at once.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._plc_executor, func, *args)
+
+    async def _monitor(self):
+        """Run monitoring cycles at a fixed rate
+
+        The interval is measured from the start of each cycle, so the time
+        spent waiting for the AI response is part of the interval instead
+        of being added to it.
+        """
+        loop = asyncio.get_running_loop()
         while self.running:
+            cycle_start = loop.time()
             try:
-                # Read current sensor data
-                sensor_data = self.plc.read_all_sensor_data()
-                if not sensor_data:
-                    logger.error("Sensör verileri okunamadı")
-                    time.sleep(self.monitoring_interval)
-                    continue
-
-                # Get time of day for context
-                import datetime
-                current_time = datetime.datetime.now()
-                hour = current_time.hour
-                time_context = ""
-                if 6 <= hour < 12:
-                    time_context = "Şu an sabah vakti."
-                elif 12 <= hour < 18:
-                    time_context = "Şu an öğleden sonra/öğle vakti."
-                else:
-                    time_context = "Şu an akşam/gece vakti."
-
-                print("-----------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------")
-
-                # Get AI recommendations
-                analysis_result = self.ai_agent.analyze_data(
-                    sensor_data, time_context)
-
-                print("-----------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------")
-
-                logger.info(f"AI analizi: {analysis_result['analiz']}\n")
-                self.plc.write_db_string(1, 0, util(
-                    analysis_result['analiz'][:100]))
-                self.plc.write_db_string(2, 0, util(
-                    analysis_result['analiz'][100:200]))
-                self.plc.write_db_string(3, 0, util(
-                    analysis_result['analiz'][200:250]))
-
-                j = 0
-
-                for j in range(5):
-                    self.plc.write_db_string(4+j, 0, "")
-
-                i = 0
-
-                # Process any alerts
-                for alert in analysis_result.get("uyarılar", []):
-                    logger.warning(f"UYARI: {alert}\n")
-                    i = i+1
-                    if i == 1:
-                        self.plc.write_db_string(
-                            4, 0, f"1.UYARI: {util(alert[:100])}")
-                    if i == 2:
-                        self.plc.write_db_string(
-                            5, 0, f"2.UYARI: {util(alert[:100])}")
-                    if i == 3:
-                        self.plc.write_db_string(
-                            6, 0, f"3.UYARI: {util(alert[:100])}")
-                    if i == 4:
-                        self.plc.write_db_string(
-                            7, 0, f"4.UYARI: {util(alert[:100])}")
-                    if i == 5:
-                        self.plc.write_db_string(
-                            8, 0, f"5.UYARI: {util(alert[:100])}")
-
-                # Execute recommended actions
-                for action in analysis_result.get("eylemler", []):
-                    equipment_name = action.get(
-                        "ekipman")
-                    state = action.get("durum")
-                    reason = action.get("neden", "Neden belirtilmedi")
-
-                    print("-----------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------")
-
-                    # Check if equipment exists in mapping
-                    if equipment_name in self.equipment_mapping:
-                        output_address = self.equipment_mapping[equipment_name]
-                        logger.info(
-                            f"Eylem uygulanıyor: {equipment_name} = {state} ({reason})")
-                        success = self.plc.write_bool(output_address, state)
-                        if not success:
-                            logger.error(
-                                f"Eylem uygulanamadı: {equipment_name} = {state}")
-                    else:
-                        logger.warning(f"Bilinmeyen ekipman: {equipment_name}")
-
-                # Wait for next cycle
-                time.sleep(self.monitoring_interval)
-
+                await self._monitor_cycle()
             except Exception as e:
                 logger.error(f"İzleme döngüsünde hata: {str(e)}")
-                time.sleep(self.monitoring_interval)
+
+            # Wait for next cycle
+            await asyncio.sleep(
+                max(0.0, cycle_start + self.monitoring_interval - loop.time()))
+
+    def _sync_caches(self):
+        """Drop write and analysis caches if the PLC reconnected since they were filled
+
+        After a reconnect the PLC may have restarted with its outputs and
+        DBs reset, so earlier writes can no longer be assumed in place.
+        """
+        if self.plc.connection_generation != self._cache_generation:
+            self._cache_generation = self.plc.connection_generation
+            self._last_outputs = {}
+            self._last_status_strings = []
+            self._last_sensors = {}
+
+    def _trend_context(self) -> str:
+        """Summarize recent sensor readings as mean and slope per reading
+
+        Returns:
+            Trend text for the AI prompt, empty if there is not enough history
+        """
+        count = len(self._history)
+        if count < 2:
+            return ""
+
+        # Least-squares slope over reading index 0..count-1
+        x_mean = (count - 1) / 2
+        x_var = sum((x - x_mean) ** 2 for x in range(count))
+
+        lines = [f"Son {count} ölçümün ortalaması ve ölçüm başına eğilimi:"]
+        for name in SENSOR_ADDRESSES:
+            values = [reading[name]
+                      for reading in self._history if name in reading]
+            if len(values) != count:
+                continue
+            mean = sum(values) / count
+            slope = sum((x - x_mean) * (value - mean)
+                        for x, value in enumerate(values)) / x_var
+            lines.append(f"- {name}: ortalama {mean:.2f}, eğilim {slope:+.2f}")
+        return "\n".join(lines)
+
+    def _sensors_changed(self, sensor_data: Dict[str, float]) -> bool:
+        """Check whether any sensor moved past its epsilon since the last analysis
+
+        Args:
+            sensor_data: Dictionary of current sensor values
+
+        Returns:
+            True if a new analysis is needed
+        """
+        if not self._last_sensors:
+            return True
+
+        for name, value in sensor_data.items():
+            last_value = self._last_sensors.get(name)
+            if last_value is None or abs(value - last_value) >= SENSOR_EPSILONS.get(name, 0.0):
+                return True
+        return False
+
+    async def _monitor_cycle(self):
+        """Read sensor data, get AI recommendations and apply them"""
+        # Refresh the cached PLC connection state once per cycle
+        await self._run_plc(self.plc.check_connection)
+
+        # Read current sensor data
+        sensor_data = await self._run_plc(self.plc.read_all_sensor_data)
+        if not sensor_data:
+            logger.error("Sensör verileri okunamadı")
+            return
+        self._history.append(sensor_data)
+        self._sync_caches()
+
+        # Get time of day for context
+        time_context = TIME_CONTEXTS[datetime.datetime.now().hour]
+
+        # Skip the AI call when nothing meaningfully changed
+        if time_context == self._last_time_context and not self._sensors_changed(sensor_data):
+            logger.info("Sensör verileri değişmedi, AI analizi atlandı")
+            return
+
+        print("-----------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------")
+
+        # Get AI recommendations
+        analysis_result = await self.ai_agent.analyze_data(
+            sensor_data, f"{time_context}\n{self._trend_context()}")
+
+        print("-----------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------")
+
+        analysis = analysis_result.get("analiz", "")
+        logger.info("AI analizi: %s\n", analysis)
+        status_strings = [
+            util(analysis[:100]),
+            util(analysis[100:200]),
+            util(analysis[200:250]),
+            "", "", "", "", ""
+        ]
+
+        # Process any alerts; only the first five have a PLC slot
+        for i, alert in enumerate(analysis_result.get("uyarılar", []), start=1):
+            logger.warning("UYARI: %s\n", alert)
+            if i <= 5:
+                status_strings[2 + i] = f"{i}.UYARI: {util(alert[:100])}"
+
+        # Execute recommended actions; states are collected and
+        # written to the PLC together after the loop
+        states = {}
+        for action in analysis_result.get("eylemler", []):
+            equipment_name = action.get(
+                "ekipman")
+            state = action.get("durum")
+            reason = action.get("neden", "Neden belirtilmedi")
+
+            print("-----------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------------")
+
+            # Check if equipment exists in mapping
+            if equipment_name in self.equipment_mapping:
+                logger.info("Eylem uygulanıyor: %s = %s (%s)",
+                            equipment_name, state, reason)
+                states[equipment_name] = bool(state)
+            else:
+                logger.warning("Bilinmeyen ekipman: %s", equipment_name)
+
+        # Only a fully applied analysis may suppress the next AI call;
+        # otherwise the next cycle analyzes and writes again
+        if (await self._apply_writes(status_strings, states)
+                and AI_ERROR_ALERT not in analysis_result.get("uyarılar", [])):
+            self._last_sensors = sensor_data
+            self._last_time_context = time_context
+
+    async def _apply_writes(self, status_strings: List[str], states: Dict[str, bool]) -> bool:
+        """Write status strings and equipment states that changed since the last write
+
+        Args:
+            status_strings: Analysis and alert slots for the status DB
+            states: Mapping of equipment name to requested state
+
+        Returns:
+            Success status (True/False)
+        """
+        try:
+            success = True
+
+            # Write analysis and alert slots to the status DB in one request
+            self._sync_caches()
+            if status_strings != self._last_status_strings:
+                if await self._run_plc(self.plc.write_db_strings, STATUS_DB_NUMBER, 0, status_strings):
+                    self._last_status_strings = status_strings
+                else:
+                    success = False
+
+            # Only write outputs whose state differs from the last write
+            self._sync_caches()
+            changed = {name: state for name, state in states.items()
+                       if self._last_outputs.get(name) != state}
+            bits = {self._equipment_bits[name]: state
+                    for name, state in changed.items()}
+            if await self._run_plc(self.plc.write_bool_masks, bits):
+                self._last_outputs.update(changed)
+            else:
+                logger.error(f"Eylemler uygulanamadı: {changed}")
+                success = False
+            return success
+        except Exception as e:
+            logger.error(f"PLC yazma hatası: {str(e)}")
+            return False
 
 
 # Example usage